@@ -5,57 +5,38 @@ import dot
 
 ################################################################################
 def format_node(n):
-    fmt = 'node [label="%s&#92;n%s", shape="rectangle"] %s;'
-    fmt_s = 'node [label="%s", shape="rectangle"] %s;'
     if type(n) == list:
-        return 'node [label="", shape="circle"] %s;' % nid(n)
+        return f'node [label="", shape="circle"] {nid(n)};'
 
     if n.terminal:
         label = n.value.replace('"', '\\"')
         if n.type == 'EPSILON':
-            return 'node [label="&epsilon;", shape="rectangle"] %s;' % nid(n)
-            return fmt % ('&epsilon;', '', nid(n))
+            return f'node [label="&epsilon;", shape="rectangle"] {nid(n)};'
         else:
             if not n.type:
-                return fmt_s % (label, nid(n))
-            return fmt % (n.type, label, nid(n))
+                return f'node [label="{label}", shape="rectangle"] {nid(n)};'
+            return f'node [label="{n.type}&#92;n{label}", shape="rectangle"] {nid(n)};'
     else:
-        return 'node [label="%s", shape="oval"] %s;' % (n.type, nid(n))
+        return f'node [label="{n.type}", shape="oval"] {nid(n)};'
 
     
-def nid(n): return 'n_%s' % id(n)
+def nid(n): return f'n_{id(n)}'
 
 
 def format_edge(src, dest, invis=False):
-    fmt = '%s -> %s [style=invis];' if invis else '%s -> %s;'
-    return fmt % (nid(src), nid(dest))
+    if invis: return f'{nid(src)} -> {nid(dest)} [style=invis];'
+    return f'{nid(src)} -> {nid(dest)};'
 
 
-def nodes(T):
-    yield T
+def walk(T, parent=None):
+    yield (T, parent)
     if type(T) == list:
-        for t in T:
-            for n in nodes(t): yield n
+        for t in T: yield from walk(t, T)
     elif not T.terminal:
-        for t in T.value:
-            for n in nodes(t): yield n
-            
-
-def terminals(T): return (n for n in nodes(T) if getattr(n, 'terminal', False))
-
-
-def edges(src):
-    if type(src) == list:
-        for dest in src:
-            yield (src, dest)
-            for e in edges(dest): yield e
-    elif not src.terminal:
-        for dest in src.value:
-            yield (src, dest)
-            for e in edges(dest): yield e
+        for t in T.value: yield from walk(t, T)
 
             
-def make_rank(ns): return '{rank=same;%s}' % ';'.join(map(nid, ns))
+def make_rank(ns): return f'{{rank=same;{";".join(map(nid, ns))}}}'
 
 
  
@@ -67,10 +48,14 @@ def parse_tree(T, unconsumed="", display=True):
     emit('color="#ffffffff";')
     emit('bgcolor="#ffffff00";')
      
-    for n in nodes(T): emit(format_node(n))
-    for e in edges(T): emit(format_edge(*e))
+    edges = []
+    terms = []
+    for (n, parent) in walk(T):
+        emit(format_node(n))
+        if parent is not None: edges.append(format_edge(parent, n))
+        if getattr(n, 'terminal', False): terms.append(n)
+    acc.extend(edges)
 
-    terms = list(terminals(T))
     last = None
     for t in terms:
         if last: emit(format_edge(last, t, invis=True))
@@ -78,8 +63,8 @@ def parse_tree(T, unconsumed="", display=True):
 
     unconsumed = unconsumed.strip()
     if unconsumed:
-        emit('node [label="unconsumed: %s", shape="none"] unconsumed' % unconsumed)
-        emit('%s -> unconsumed [style=invis]' % nid(last))
+        emit(f'node [label="unconsumed: {unconsumed}", shape="none"] unconsumed')
+        emit(f'{nid(last)} -> unconsumed [style=invis]')
         
     emit(make_rank(terms))
     emit('}')
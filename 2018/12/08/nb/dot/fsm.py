@@ -1,24 +1,24 @@
 #! /usr/bin/env python
 
+from collections import defaultdict
 from dot import imgtex
 
 def trim(start, accepts, delta, nfa=False):
-    atled = {}
+    atled = defaultdict(list)
     for q in delta:
         for s in delta[q]:
             if nfa:
                 for r in delta[q][s]:
-                    atled.setdefault(r, {}).setdefault(s, set()).add(q)
+                    atled[r].append(q)
             else:
-                r = delta[q][s]
-                atled.setdefault(r, {}).setdefault(s, set()).add(q)
+                atled[delta[q][s]].append(q)
     visited = set()
     todo = set(accepts)
     while todo:
         q = todo.pop()
         if q in visited: continue
         visited.add(q)
-        for (s, rs) in atled.get(q, {}).items(): todo |= set(rs)
+        todo.update(atled.get(q, ()))
 
     delta2 = {}
     for q in delta:
@@ -35,21 +35,26 @@ def trim(start, accepts, delta, nfa=False):
 
     return delta2
 
+def char_code(x):
+    return ord(x) if isinstance(x, str) and len(x) == 1 else None
+
 def collapse_ranges(xs):
     xs2 = sorted(xs)
     acc = [xs2[0]]
+    last = char_code(xs2[0])
     
     for x in xs2[1:]:
-        try:
-            if ord(x) == ord(acc[-1]) + 1:
-                acc.append(x)
-                continue
-        except: pass
+        code = char_code(x)
+        if code is not None and last is not None and code == last + 1:
+            acc.append(x)
+            last = code
+            continue
         
-        yield acc[0] if len(acc) == 1 else '%s-%s' % (acc[0], acc[-1])
+        yield acc[0] if len(acc) == 1 else f'{acc[0]}-{acc[-1]}'
         acc = [x]
+        last = code
         
-    yield acc[0] if len(acc) == 1 else '%s-%s' % (acc[0], acc[-1])
+    yield acc[0] if len(acc) == 1 else f'{acc[0]}-{acc[-1]}'
     
 def fsm(start, accepts, delta, nfa=False, label_states=True, trim_unreachable=True):
     accepts = set(accepts)
@@ -74,12 +79,14 @@ def fsm(start, accepts, delta, nfa=False, label_states=True, trim_unreachable=Tr
 
     other = states - accepts
 
-    n = lambda q: "q_%s" % str(q).replace(' ', '_')
+    n = lambda q: "q_" + str(q).replace(' ', '_')
     l = lambda s: '&epsilon;' if s == None else s
+    state_label = lambda q: q if label_states else ""
+    edge_label = lambda lbls: ','.join(map(l, sorted(collapse_ranges(lbls))))
         
-    na = '\n'.join('node [label="%s", shape="doublecircle"] %s;' % (a if label_states else "", n(a)) for a in accepts)
-    ss = '\n'.join('node [label="%s", shape="circle"] %s;' % (s if label_states else "",n(s)) for s in other)
-    edges = '\n'.join('%s -> %s [label="%s"];' % (n(src), n(dest), ','.join(map(l, sorted(collapse_ranges(lbls))))) for ((src, dest), lbls) in edges_.items())
+    na = '\n'.join(f'node [label="{state_label(a)}", shape="doublecircle"] {n(a)};' for a in accepts)
+    ss = '\n'.join(f'node [label="{state_label(s)}", shape="circle"] {n(s)};' for s in other)
+    edges = '\n'.join(f'{n(src)} -> {n(dest)} [label="{edge_label(lbls)}"];' for ((src, dest), lbls) in edges_.items())
         
     acc = '''
 digraph g {
@@ -5,7 +5,6 @@ from IPython.core.magic import (Magics, magics_class,
 from IPython.display import SVG, display, Image
 
 import subprocess as sp
-import os
 
 @magics_class
 class imgtex(Magics):
@@ -13,11 +12,8 @@ class imgtex(Magics):
     def latex(self, line, cell):
         p = sp.Popen("imgtex foo.png".split(),
                      stdin=sp.PIPE,
-                     stdout=sp.PIPE,
-                     encoding='utf8')
-        p.stdin.write(cell)
-        p.stdin.close()
-        buf = os.read(p.stdout.fileno(), 2**32)
+                     stdout=sp.PIPE)
+        buf, _ = p.communicate(cell.encode('utf8'))
         display(Image(data=buf, format='png'))
 
 def load_ipython_extension(ipython):
@@ -1,66 +1,117 @@
 #! /usr/bin/env python3
 'useful utilities for manipulating Sudoku puzzles'
 
-import copy
-from functools import reduce
+from functools import lru_cache
 import random
 from math import inf
 class board:
     'Utility class for representing and tracking board state.'
 
-    def __init__(self, known, unknown, cell2divs, div2cells):
+    def __init__(self, known, unknown, cell2divs, div2cells, peers, overlaps,
+                 valid=None):
         '''
         known   dictionary mapping known cells to their respective values
         unknown dictionary mapping unknown cells to sets of possible values
     
-        cell2divs, div2cells
-                complementary mappings describing the board structure, such as those
-                produced by board_divs
+        cell2divs, div2cells, peers, overlaps
+                mappings describing the board structure, such as those produced
+                by board_divs
+    
+        valid   whether known and unknown are free of conflicts (see isvalid);
+                worked out from them when omitted
         '''
         assert not set(known) & set(unknown)
         self.known = known
         self.unknown = unknown
         self.cell2divs = cell2divs
         self.div2cells = div2cells
+        self.peers = peers
+        self.overlaps = overlaps
+    
+        self._valid = self._conflict_free() if valid is None else valid
+    
+    def _conflict_free(self):
+        'checks every known cell against its peers, as described under isvalid'
+        return not any(self.known.get(cell) == val0
+                       or val0 in self.unknown.get(cell, ())
+                       for (cell0, val0) in self.known.items()
+                       for cell in self.peers[cell0])
     def mark(self, cell, val):
         'set cell to val, updating unknowns as necessary'
+        was_valid = self._valid
+        vals = self.unknown.pop(cell, None)
+        if was_valid and (vals is None or val not in vals):
+            self._valid = not any(self.known.get(cell2) == val
+                                  for cell2 in self.peers[cell])
         self.known[cell] = val
-        self.unknown.pop(cell, None)
     
-        for div in self.cell2divs[cell]:
-            for cell2 in self.div2cells[div]:
-                self.elim(cell2, val)
+        empty = None
+        for cell2 in self.peers[cell]:
+            vals = self.unknown.get(cell2)
+            if vals is None: continue
+            vals.discard(val)
+            if not vals: empty = cell2
+        if not was_valid: self._valid = self._conflict_free()
+        if empty is not None: raise Contradiction(empty)
     
     def elim(self, cell, val):
         "remove val from cell's possibilities"
-        self.unknown.get(cell, set()).discard(val)
+        vals = self.unknown.get(cell)
+        if vals is None: return
+        vals.discard(val)
+        if not self._valid: self._valid = self._conflict_free()
+        if not vals: raise Contradiction(cell)
     def marked(self, cell, val):
         'returns a new board, with cell marked as val and possibilities eliminated'
         new = self.copy()
         new.mark(cell, val)
         return new
     def copy(self):
-        'copies board'
-        return self.__class__(copy.deepcopy(self.known),
-                              copy.deepcopy(self.unknown),
+        'copies board; the division mappings are shared rather than copied'
+        return self.__class__(self.known.copy(),
+                              {cell: vals.copy()
+                               for (cell, vals) in self.unknown.items()},
                               self.cell2divs,
-                              self.div2cells)
+                              self.div2cells,
+                              self.peers,
+                              self.overlaps,
+                              valid=self._valid)
     
+class Contradiction(ValueError):
+    'raised when a board is left with an unknown cell that has no possible values'
+@lru_cache(maxsize=None)
 def board_divs(order):
     '''
     generates a dictionary (cell2divs) mapping cells to their various divisions 
     in boards of the given order. Also generates a complementary mapping, 
-    div2cells. Returns (cell2divs, div2cells).
+    div2cells; a mapping (peers) from each cell to the other cells sharing any of
+    its divisions; and a mapping (overlaps) from each division to the other
+    divisions sharing two or more of its cells, paired with those shared cells.
+    Returns (cell2divs, div2cells, peers, overlaps).
+
+    Results are cached and shared by every board of the same order, so the
+    mapped values are frozensets.
     '''
     n = order**2
     box = lambda i, j: i//order * order + j//order
-    cell2divs = dict(enumerate({i,
-                                n + j,
-                                2*n + box(i, j)}
+    cell2divs = dict(enumerate(frozenset({i,
+                                          n + j,
+                                          2*n + box(i, j)})
                                for i in range(n)
                                for j in range(n)))
+    div2cells = {div: frozenset(cells)
+                 for (div, cells) in transpose(cell2divs).items()}
+    peers = {cell: frozenset(cell2
+                             for div in divs
+                             for cell2 in div2cells[div]) - {cell}
+             for (cell, divs) in cell2divs.items()}
+    shared = lambda div0, div: div2cells[div0] & div2cells[div]
+    overlaps = {div0: tuple((div, shared(div0, div))
+                            for div in div2cells
+                            if div != div0 and len(shared(div0, div)) > 1)
+                for div0 in div2cells}
 
-    return cell2divs, transpose(cell2divs)
+    return cell2divs, div2cells, peers, overlaps
 def transpose(m):
     '''
     given a binary matrix represented as a dictionary whose values are sets,
@@ -109,7 +160,8 @@ def load_board(s, validate_vals=True):
         if val_ == '.': continue
         val = int(val_)
         if validate_vals and (val < 1 or val > n): raise ValueError
-        bd.mark(cell, val)
+        try: bd.mark(cell, val)
+        except Contradiction: pass
 
     return bd
 def blank(order):
@@ -124,17 +176,11 @@ def isvalid(bd):
     returns True if
     - no known cells' values conflict
     - no unknown cell's possibilities conflict with any known cell's value
-    '''
-    return not any(val0 in {bd.known.get(cell)} | bd.unknown.get(cell, set())
-                   for (cell0, val0) in bd.known.items()
-                   for cell in neighbors(bd, cell0)
-                   if cell in bd.known and cell != cell0)
-
-def neighbors(bd, cell0):
-    return union(bd.div2cells[div] for div in bd.cell2divs[cell0])
 
-def union(xss):
-    return {x for xs in xss for x in xs}
+    The answer is kept up to date by board.mark and board.elim, so for valid
+    boards this takes constant time.
+    '''
+    return bd._valid
 def dump_board(bd):
     'returns a "pretty printed" string representation of board bd'
     order = int((len(bd.known) + len(bd.unknown)) ** 0.25)
@@ -158,43 +204,62 @@ def dump_board(bd):
     return rule.join(rows_grpd)
 def mark_single_vals(bd):
     'applies the "single candidate" (a.k.a. "naked single") rule'
-    marked = False
-    for (cell, vals) in list(bd.unknown.items()):
-        if len(vals) == 1:
-            bd.mark(cell, set(vals).pop())
-            marked = True
+    singles = [(cell, next(iter(vals)))
+               for (cell, vals) in bd.unknown.items()
+               if len(vals) == 1]
+    for (cell, val) in singles: bd.mark(cell, val)
 
-    return marked
+    return bool(singles)
 def mark_single_cells(bd):
     'applies the "hidden single" rule'
     marked = False
-    hidden = ((val, cells.pop())
-              for div in bd.div2cells
-              for (val, cells) in placements(bd, div).items()
-              if len(cells) == 1)
-    for (val, cell) in hidden:
-        if val in bd.unknown.get(cell, set()):
-            bd.mark(cell, val)
-            marked = True
+    allmasks = {cell: bitmask(vals) for (cell, vals) in bd.unknown.items()}
+    for cells in bd.div2cells.values():
+        masks = [(cell, allmasks[cell])
+                 for cell in cells
+                 if cell in bd.unknown]
+        once = more = 0
+        for (_, mask) in masks:
+            more |= once & mask
+            once ^= mask
+        hidden = once & ~more
+        if not hidden: continue
+        for (cell, mask) in masks:
+            for val in bitvals(mask & hidden):
+                if val in bd.unknown.get(cell, ()):
+                    bd.mark(cell, val)
+                    marked = True
     return marked
-def placements(bd, div):
-    return transpose({cell: bd.unknown[cell]
-                      for cell in bd.div2cells[div]
-                      if cell in bd.unknown})
+def bitmask(vals):
+    'returns an integer with bit v set for each v in vals'
+    mask = 0
+    for val in vals: mask |= 1 << val
+    return mask
+
+def bitvals(mask):
+    'generates the values whose bits are set in mask, lowest first'
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
 def mark_excluded(bd):
     marked = False
-    excluded = ((cell, val)
-                for div0 in bd.div2cells
-                for (val, cells) in placements(bd, div0).items()
-                for div in (intersection(bd.cell2divs[cell] for cell in cells)
-                            - {div0})
-                for cell in bd.div2cells[div] - cells - set(bd.known)
-                if val in bd.unknown[cell])
-    for (cell, val) in excluded:
-        bd.elim(cell, val)
-        marked = True
+    allmasks = {cell: bitmask(vals) for (cell, vals) in bd.unknown.items()}
+    for (div0, overlaps) in bd.overlaps.items():
+        masks = [(cell, allmasks[cell])
+                 for cell in bd.div2cells[div0]
+                 if cell in bd.unknown]
+        for (div, shared) in overlaps:
+            inside = outside = 0
+            for (cell, mask) in masks:
+                if cell in shared: inside |= mask
+                else: outside |= mask
+            for val in bitvals(inside & ~outside):
+                for cell in bd.div2cells[div] - shared:
+                    if val in bd.unknown.get(cell, ()):
+                        bd.elim(cell, val)
+                        marked = True
     return marked
-def intersection(xs): return reduce(lambda a,x: a&x, xs)
 def mark_forced(bd):
     '''
     iteratively applies single candidate, hidden single, and rule of exclusion
@@ -211,14 +276,30 @@ def solve(bd0, maxguesses=inf):
     stack = [(0, bd0.copy(), None)]
     while stack:
         depth, bd, delta = stack.pop()
-        if delta: bd = bd.marked(*delta)
-        mark_forced(bd)
+        try:
+            if delta: bd = bd.marked(*delta)
+            mark_forced(bd)
+        except Contradiction: continue
         if issolved(bd): yield bd
         elif depth < maxguesses:
-            _, _, cell, vals = min((len(vals), random.random(), cell, vals)
-                                   for (cell, vals) in bd.unknown.items())
+            cell, vals = fewest_vals(bd)
             stack.extend((depth+1, bd, (cell, val))
                          for val in random.sample(vals, len(vals)))
+def fewest_vals(bd):
+    '''
+    returns (cell, vals) for an unknown cell of bd having the fewest possible
+    values, choosing uniformly at random among ties
+    '''
+    best = None
+    for (cell, vals) in bd.unknown.items():
+        nvals = len(vals)
+        if best is None or nvals < nbest:
+            best, nbest, nties = (cell, vals), nvals, 1
+            if nvals == 1: break
+        elif nvals == nbest:
+            nties += 1
+            if random.random() * nties < 1: best = (cell, vals)
+    return best
 def marked_up(order, *marks):
     '''
     returns a new board of the given order, with the given marks, (cell, val)
@@ -273,7 +354,9 @@ def isproper(bd, maxguesses=inf, clue=None):
         cell0, val0 = clue
         nsolns += 1
         for val in bd.unknown[cell0] - {val0}:
-            for soln in solve(bd.marked(cell0, val), maxguesses):
+            try: bd1 = bd.marked(cell0, val)
+            except Contradiction: continue
+            for soln in solve(bd1, maxguesses):
                 nsolns += 1
                 if nsolns > 1: return False
     else: